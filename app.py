@@ -1,15 +1,32 @@
 import streamlit as st
 from streamlit import errors
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+import plotly.io as pio
+from tsdownsample import LTTBDownsampler
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 from influxdb_client import InfluxDBClient
+try:
+    from influxdb_client_3 import InfluxDBClient3
+except ImportError:  # v2-only installs fall back to Flux
+    InfluxDBClient3 = None
 import os
+import logging
+import glob
+import tempfile
+import asyncio
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.flight as flight
+import pyarrow.parquet as pq
 from zoneinfo import ZoneInfo
 
 
 
+logger = logging.getLogger(__name__)
+
 # ---------- LOAD ENV VARIABLES ----------
 
 if os.path.exists(".env"):
@@ -36,6 +53,22 @@ INFLUX_TOKEN = get_config("Influx_API_Token")
 INFLUX_ORG = "PlantPet"
 INFLUX_BUCKET = "PlantPet"
 MEASUREMENT_NAME ="plant_status"  # Your measurement name
+LOCAL_TZ = ZoneInfo(os.getenv("LOCAL_TZ", "America/Los_Angeles"))
+# "sql" queries over Arrow Flight (InfluxDB v3 / Cloud Serverless); set to "flux" for v2-only buckets
+INFLUX_QUERY_LANGUAGE = os.getenv("INFLUX_QUERY_LANGUAGE", "sql")
+USE_SQL = InfluxDBClient3 is not None and INFLUX_QUERY_LANGUAGE == "sql"
+SQL_INTERVAL_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+# Bucket filled by tasks/downsample.flux with hourly means; leave unset until the task is deployed
+INFLUX_ROLLUP_BUCKET = os.getenv("INFLUX_ROLLUP_BUCKET")
+ROLLUP_EVERY = "1h"
+ROLLUP_MIN_DAYS = 2  # ranges this long are served from the rollup
+# Dashboard column -> InfluxDB field (note: light comes from the ldr_pct field)
+FIELD_COLUMNS = {"soil_pct": "soil_pct", "light_pct": "ldr_pct", "happiness": "happiness"}
+
+# Local Parquet cache so worker restarts only fetch the gap since the last run
+CACHE_DIR = ".cache"
+CACHE_PREFIX = "plant_status_"
+CACHE_TMP_MAX_AGE = 600  # seconds before an unfinished temp snapshot counts as abandoned
 
 # --- CONFIGURATION CONSTANTS (UNCHANGED) ---
 SOIL_WET = 700
@@ -45,6 +78,14 @@ LIGHT_HIGH = 3000
 IDEAL_SOIL_MIN = 35 # %
 IDEAL_SOIL_MAX = 75 # %
 
+# Default aggregateWindow bucket: the sensor's 10 min upload interval
+MIN_WINDOW_MINUTES = 10
+# Charts are thinned to this many points (LTTB) before going to the browser
+MAX_PLOT_POINTS = 800
+
+
+# Serialize figures with orjson (numpy arrays are written directly, no list conversion)
+pio.json.config.default_engine = "orjson"
 
 # ---------- PAGE CONFIG (UNCHANGED) ----------
 st.set_page_config(
@@ -134,31 +175,166 @@ h3 {
 """
 st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
+CARD_DIVIDER = "<hr style='border:0;border-top:1px solid rgba(148,163,184,0.2);margin:8px 0 12px;'>"
+
+def utc_to_local_naive(values: np.ndarray) -> np.ndarray:
+    """
+    Shift naive UTC datetime64[ns] values to naive LOCAL_TZ wall-clock time.
+    Both the zone cast and the wall-clock conversion are Arrow compute kernels,
+    so DST is honoured without building tz-aware pandas objects.
+    """
+    ts_utc = pa.array(values, type=pa.timestamp("ns", tz="UTC"))
+    ts_local = pc.cast(ts_utc, pa.timestamp("ns", tz=LOCAL_TZ.key))
+    return pc.local_timestamp(ts_local).to_numpy(zero_copy_only=False)
+
+@st.cache_resource
+def get_influx_client():
+    """
+    Shared InfluxDB client, kept alive across reruns so the HTTPS connection
+    pool (and its TLS session) is reused. Responses are gzip-compressed.
+    """
+    return InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG, enable_gzip=True)
+
+@st.cache_resource
+def get_influx_sql_client():
+    """
+    Shared InfluxDB v3 client; SQL results stream back over Arrow Flight.
+    """
+    return InfluxDBClient3(host=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG, database=INFLUX_BUCKET)
+
+@st.cache_resource
+def sql_state():
+    """
+    Process-wide switch for the SQL path: on until the first Flight failure.
+    """
+    return {"enabled": USE_SQL}
+
+def utc_index(index: pd.Index) -> pd.DatetimeIndex:
+    """
+    _time as naive UTC datetime64[ns], the one index type both query paths return.
+    """
+    return pd.DatetimeIndex(index.to_numpy(dtype="datetime64[ns]"), name="_time")
+
+def sql_interval(every: str) -> str:
+    """
+    Turn a Flux duration such as "20m" into a SQL interval such as "20 minutes".
+    """
+    return f"{every[:-1]} {SQL_INTERVAL_UNITS[every[-1]]}"
+
+def query_sql(bucket, start, every=None):
+    """
+    Run the downsampling query as SQL over Flight. Rows come back as Arrow record
+    batches with one column per field, so no CSV parsing or pivot is needed.
+    Windows are labelled by their end time, like Flux's aggregateWindow.
+    With every=None the rows are returned as stored (already rolled up).
+    """
+    if every is None:
+        columns = "time AS _time, soil_pct, ldr_pct, happiness"
+        group_by = ""
+    else:
+        interval = sql_interval(every)
+        columns = f'''
+        date_bin(INTERVAL '{interval}', time) + INTERVAL '{interval}' AS _time,
+        avg(soil_pct) AS soil_pct,
+        avg(ldr_pct) AS ldr_pct,
+        avg(happiness) AS happiness'''
+        group_by = "GROUP BY 1"
+    query = f'''
+    SELECT {columns}
+    FROM "{MEASUREMENT_NAME}"
+    WHERE time >= '{start:%Y-%m-%dT%H:%M:%SZ}'
+    {group_by}
+    '''
+    table = get_influx_sql_client().query(query, language="sql", mode="all", database=bucket)
+    result = table.to_pandas(types_mapper=pd.ArrowDtype).set_index('_time')
+    result.index = utc_index(result.index)
+    return result
+
+def query_flux_field(query_api, bucket, field, start, every=None):
+    """
+    Run the downsampling query for a single field as Flux over the v2 API (annotated CSV).
+    Returns the windowed means as a Series indexed by _time.
+    With every=None the points are returned as stored (already rolled up).
+    """
+    # 🟢 Flux query to fetch one sensor field for last N days
+    # Keep range -> filter -> aggregateWindow in this exact shape (plain equality
+    # filters, no pivot) so InfluxDB pushes the mean down to the storage layer.
+    aggregate = "" if every is None else f"|> aggregateWindow(every: {every}, fn: mean, createEmpty: false)"
+    query = f'''
+    from(bucket: "{bucket}")
+        |> range(start: {start:%Y-%m-%dT%H:%M:%SZ})
+        |> filter(fn: (r) => r["_measurement"] == "{MEASUREMENT_NAME}")
+        |> filter(fn: (r) => r["_field"] == "{field}")
+        {aggregate}
+    '''
+    
+    # Stream the result tables and stitch them together without an extra copy
+    frames = list(query_api.query_data_frame_stream(query, org=INFLUX_ORG, data_frame_index=['_time']))
+    if not frames:
+        return pd.Series(name=field, dtype='float64', index=pd.DatetimeIndex([], tz='UTC', name='_time'))
+    return pd.concat(frames, copy=False)['_value'].rename(field)
+
+async def gather_flux_fields(query_api, bucket, start, every):
+    """
+    Query every field concurrently, each on its own worker thread.
+    """
+    return await asyncio.gather(*(
+        asyncio.to_thread(query_flux_field, query_api, bucket, field, start, every)
+        for field in FIELD_COLUMNS.values()
+    ))
+
+def query_flux(bucket, start, every=None):
+    """
+    Run the downsampling query as Flux, one query per field in parallel.
+    Per-field queries keep the window aggregate pushed down; the pivot happens
+    here as a column-wise concat aligned on _time.
+    """
+    query_api = get_influx_client().query_api()
+    fields = asyncio.run(gather_flux_fields(query_api, bucket, start, every))
+    result = pd.concat(fields, axis=1)
+    result.index = utc_index(result.index)
+    return result
+
+def run_query(bucket, start, every=None):
+    """
+    Query with SQL over Flight when enabled. If the endpoint or token does not
+    support Flight (v2-only buckets), switch SQL off for this process and use Flux.
+    """
+    state = sql_state()
+    if state["enabled"]:
+        try:
+            return query_sql(bucket, start, every)
+        except flight.FlightError:
+            logger.warning("SQL query over Arrow Flight failed, using Flux from now on", exc_info=True)
+            state["enabled"] = False
+    return query_flux(bucket, start, every)
+
 # 🟢 NEW: Function to fetch data from InfluxDB
 @st.cache_data(ttl=600)  # Cache for 10 minutes (matches your data update frequency)
-def fetch_influxdb_data(days=7):
+def fetch_influxdb_data(days=7, every="10m", start=None):
     """
-    Fetch sensor data from InfluxDB for the last N days.
-    Returns a DataFrame with columns: timestamp, soil_pct, light_pct, happiness
+    Fetch sensor data from InfluxDB for the last N days, averaged into `every` windows.
+    If `start` (a UTC timestamp) is given, only data from that point on is fetched.
+    Hourly windows are read from the rollup bucket, except for the current hour.
+    Uses SQL over Arrow Flight when available, Flux otherwise.
+    Returns a DataFrame with columns: timestamp, soil_pct, light_pct, happiness,
+    plus utc_time (naive UTC) which the Parquet cache uses as its key
     """
+    if start is None:
+        start = pd.Timestamp.now(tz="UTC") - timedelta(days=days)
+    
     try:
-        client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
-        query_api = client.query_api()
-        
-        # 🟢 Flux query to fetch sensor data for last N days
-        # Assumes your InfluxDB has fields: soil_pct, ldr_pct, happiness
-        query = f'''
-        from(bucket: "{INFLUX_BUCKET}")
-            |> range(start: -{days}d)
-            |> filter(fn: (r) => r["_measurement"] == "{MEASUREMENT_NAME}")
-            |> filter(fn: (r) => r["_field"] == "soil_pct" or r["_field"] == "ldr_pct" or r["_field"] == "happiness")
-            |> aggregateWindow(every: 10m, fn: mean, createEmpty: false)
-            |> pivot(rowKey:["_time"], columnKey: ["_field"], valueColumn: "_value")
-        '''
-        
-        # Execute query and convert to DataFrame
-        result = query_api.query_data_frame(query)
-        client.close()
+        if INFLUX_ROLLUP_BUCKET and every == ROLLUP_EVERY:
+            # Completed hours are pre-averaged by tasks/downsample.flux. The previous
+            # hour (the task may not have run yet) and the one in progress are averaged
+            # from the raw bucket and win on overlap
+            current_hour = pd.Timestamp.now(tz="UTC").floor("h")
+            rolled_up = run_query(INFLUX_ROLLUP_BUCKET, start)
+            recent = run_query(INFLUX_BUCKET, max(start, current_hour - timedelta(hours=1)), every)
+            result = pd.concat([rolled_up, recent])
+            result = result[~result.index.duplicated(keep="last")]
+        else:
+            result = run_query(INFLUX_BUCKET, start, every)
         
         if result.empty:
             st.warning("No data found in InfluxDB for the specified time range.")
@@ -166,17 +342,18 @@ def fetch_influxdb_data(days=7):
         
         # 🟢 Clean up the dataframe
         # Rename columns to match expected format
-        LOCAL_TZ = ZoneInfo(os.getenv("LOCAL_TZ", "America/Los_Angeles"))
-        df = pd.DataFrame()
-        utc_times = pd.to_datetime(result['_time'], utc=True)
-        local_times = utc_times.dt.tz_convert(LOCAL_TZ)
-        df['timestamp'] = local_times.dt.tz_localize(None)
-        df['soil_pct'] = result.get('soil_pct', 0)
-        df['light_pct'] = result.get('ldr_pct', 0)  # Note: using ldr_pct from InfluxDB
-        df['happiness'] = result.get('happiness', 0)
+        # _time is already a naive UTC index from either query path, so no pd.to_datetime pass
+        utc_times = result.index.to_numpy(dtype='datetime64[ns]')
+        df = pd.DataFrame({'timestamp': utc_to_local_naive(utc_times), 'utc_time': utc_times})
+        # Percentages (0-100) fit in float32, which halves the bytes every later step moves
+        for column, field in FIELD_COLUMNS.items():
+            if field in result.columns:
+                df[column] = result[field].to_numpy(dtype='float32', na_value=np.nan)
+            else:
+                df[column] = np.float32(0)
         
         # Sort by timestamp
-        df = df.sort_values('timestamp').reset_index(drop=True)
+        df = df.sort_values('utc_time').reset_index(drop=True)
         
         return df
         
@@ -184,13 +361,102 @@ def fetch_influxdb_data(days=7):
         st.error(f"Error fetching data from InfluxDB: {str(e)}")
         return None
 
+def window_for_days(days: int) -> str:
+    """
+    Pick the default aggregateWindow interval (Flux duration) for a range of N days:
+    the sensor's upload interval, or the hourly rollup for long ranges when one is configured.
+    Pass `every` to load_data() to choose another resolution.
+    """
+    if INFLUX_ROLLUP_BUCKET and days >= ROLLUP_MIN_DAYS:
+        return ROLLUP_EVERY
+    return f"{MIN_WINDOW_MINUTES}m"
+
+def read_cached_data(every: str):
+    """
+    Return the newest Parquet snapshot at `every` resolution from CACHE_DIR, or None if there is none.
+    An unreadable snapshot (e.g. left by a worker killed mid-write) counts as a miss and is deleted.
+    """
+    paths = sorted(glob.glob(os.path.join(CACHE_DIR, f"{CACHE_PREFIX}{every}_*.parquet")))
+    if not paths:
+        return None
+    try:
+        return pd.read_parquet(paths[-1], engine="pyarrow")
+    except (OSError, pa.ArrowException):
+        try:
+            os.remove(paths[-1])
+        except OSError:
+            pass  # Already pruned by another session
+        return None
+
+def write_cached_data(df: pd.DataFrame, every: str):
+    """
+    Save df as this hour's Parquet snapshot for `every` and remove all older ones.
+    The file is written under a temporary name and renamed into place, so readers
+    never see a partial snapshot.
+    """
+    path = os.path.join(CACHE_DIR, f"{CACHE_PREFIX}{every}_{datetime.now(timezone.utc):%Y%m%d%H}.parquet")
+    tmp_path = None
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=CACHE_PREFIX, suffix=".parquet.tmp")
+        os.close(fd)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(table, tmp_path, compression="zstd", use_dictionary=True)
+        os.replace(tmp_path, path)
+        tmp_path = None
+    except (OSError, pa.ArrowException):
+        return  # Read-only filesystem: keep running without the disk cache
+    finally:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    
+    # Prune older snapshots, plus temp files abandoned by killed workers
+    stale_tmp_before = datetime.now().timestamp() - CACHE_TMP_MAX_AGE
+    for old_path in glob.glob(os.path.join(CACHE_DIR, f"{CACHE_PREFIX}*.parquet*")):
+        try:
+            if old_path.endswith(".tmp"):
+                if os.path.getmtime(old_path) < stale_tmp_before:
+                    os.remove(old_path)
+            elif old_path != path:
+                os.remove(old_path)
+        except OSError:
+            pass  # Already removed by another session
+
 # 🟢 NEW: Load data function that uses InfluxDB
 @st.cache_data(ttl=600)
-def load_data():
+def load_data(days=7, every=None):
     """
-    Load real data from InfluxDB instead of generating dummy data
+    Load real data from InfluxDB instead of generating dummy data.
+    Starts from the Parquet cache and only queries InfluxDB for newer windows.
     """
-    df = fetch_influxdb_data(days=7)
+    if every is None:
+        every = window_for_days(days)
+    
+    cached = read_cached_data(every)
+    if cached is None or cached.empty:
+        df = fetch_influxdb_data(days=days, every=every)
+    else:
+        # Windows are labelled by their end time, and the newest one may have been
+        # partial when cached (Flux labels it with the query's stop time). Re-fetch
+        # from the start of that window, aligned to the `every` grid.
+        step = pd.Timedelta(every)
+        last_utc = pd.Timestamp(cached["utc_time"].max(), tz="UTC")
+        window_start = (pd.Timestamp.now(tz="UTC") - timedelta(days=days)).floor(step)
+        start = max(last_utc.ceil(step) - step, window_start)
+        fresh = fetch_influxdb_data(days=days, every=every, start=start)
+        if fresh is None:
+            df = cached
+        else:
+            # Every cached row labelled after `start` is superseded by the fresh windows
+            cached = cached[cached["utc_time"] <= start.tz_localize(None)]
+            df = pd.concat([cached, fresh], ignore_index=True)
+        # Dedupe on UTC: local wall-clock times repeat in the DST fall-back hour
+        df = df.drop_duplicates("utc_time", keep="last").sort_values("utc_time")
+        df = df[df["utc_time"] > df["utc_time"].max() - timedelta(days=days)].reset_index(drop=True)
+    
+    if df is not None and not df.empty:
+        write_cached_data(df, every)
+        df = df.drop(columns="utc_time")
     
     if df is None or df.empty:
         # Fallback: create empty dataframe with expected structure
@@ -201,20 +467,54 @@ def load_data():
 
 # ---------- REUSABLE FUNCTIONS (UNCHANGED) ----------
 
+# Health colour per whole percent: red below 40, yellow below 70, green otherwise
+HEALTH_COLORS = np.array(["#ef4444"] * 40 + ["#facc15"] * 30 + ["#22c55e"] * 31)
+
 def get_health_color(value: float):
-    if value < 40:
-        return "#ef4444"  # Red
-    elif value < 70:
-        return "#facc15"  # Yellow
-    else:
-        return "#22c55e"  # Green
+    if np.isnan(value):
+        return HEALTH_COLORS[-1]  # A window missing its happiness value shows green, as before
+    return HEALTH_COLORS[min(100, max(0, int(value)))]
 
-def plot_sensor_data(df_filtered: pd.DataFrame, y_column: str, color: str, ideal_min: float = None, ideal_max: float = None, yaxis_title: str = None):
+def downsample(x: np.ndarray, y: np.ndarray, n_out: int = MAX_PLOT_POINTS):
+    """
+    Thin a series to n_out points with LTTB, which keeps the visual shape of the line.
+    """
+    if len(x) <= n_out:
+        return x, y
+    idx = LTTBDownsampler().downsample(x.view("i8"), y, n_out=n_out)
+    return x[idx], y[idx]
+
+def chart_arrays(frame: pd.DataFrame) -> dict[str, np.ndarray]:
+    """
+    Pull the timestamp and sensor columns out of a slice once, as plain ndarrays.
+    """
+    arrays = {"timestamp": frame["timestamp"].to_numpy(dtype="datetime64[ns]")}
+    for column in FIELD_COLUMNS:
+        arrays[column] = frame[column].to_numpy(dtype="float32")
+    return arrays
+
+def time_range(timestamps: np.ndarray, start, end, is_sorted: bool, inclusive: str = "both"):
+    """
+    Indexer for the timestamps between start and end (`inclusive` as in Series.between).
+    Sorted data gets a slice from two binary searches (a view, no copy); otherwise
+    a single between() pass picks the matching positions, returned in time order.
+    """
+    start, end = np.datetime64(start, "ns"), np.datetime64(end, "ns")
+    if is_sorted:
+        lo = timestamps.searchsorted(start, side="left" if inclusive in ("both", "left") else "right")
+        hi = timestamps.searchsorted(end, side="right" if inclusive in ("both", "right") else "left")
+        return slice(lo, hi)
+    mask = pd.Series(timestamps, copy=False).between(pd.Timestamp(start), pd.Timestamp(end), inclusive=inclusive)
+    positions = np.flatnonzero(mask.to_numpy())
+    return positions[np.argsort(timestamps[positions], kind="stable")]
+
+def plot_sensor_data(x: np.ndarray, y: np.ndarray, color: str, ideal_min: float = None, ideal_max: float = None, yaxis_title: str = None):
     # Function implementation remains the same
+    x, y = downsample(x, y)
     fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=df_filtered["timestamp"],
-        y=df_filtered[y_column],
+    fig.add_trace(go.Scattergl(
+        x=x,
+        y=y,
         mode="lines",
         line=dict(width=2, color=color)
     ))
@@ -244,6 +544,70 @@ def plot_sensor_data(df_filtered: pd.DataFrame, y_column: str, color: str, ideal
     )
     return fig
 
+def corr_figure(data: dict[str, np.ndarray]):
+    """
+    Build the happiness/soil/light overlay straight from the ndarray slice.
+    """
+    # 🟢 MODIFIED: Now includes happiness score in the chart
+    happiness_x, happiness_y = downsample(data["timestamp"], data["happiness"])
+    soil_x, soil_y = downsample(data["timestamp"], data["soil_pct"])
+    light_x, light_y = downsample(data["timestamp"], data["light_pct"])
+
+    corr_fig = go.Figure()
+
+    # 🟢 NEW: Add happiness score trace
+    corr_fig.add_trace(go.Scattergl(
+        x=happiness_x,
+        y=happiness_y,
+        mode="lines",
+        name="Happiness (%)",
+        line=dict(width=3, color="#22c55e"),
+        yaxis="y1"
+    ))
+
+    corr_fig.add_trace(go.Scattergl(
+        x=soil_x,
+        y=soil_y,
+        mode="lines",
+        name="Soil (%)",
+        line=dict(width=2, color="#38bdf8", dash="dash"),
+        yaxis="y1"
+    ))
+
+    corr_fig.add_trace(go.Scattergl(
+        x=light_x,
+        y=light_y,
+        mode="lines",
+        name="Light (%)",
+        line=dict(width=2, color="#facc15", dash="dot"),
+        yaxis="y1"
+    ))
+
+    corr_fig.update_layout(
+        height=350,
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        margin=dict(l=0, r=0, t=20, b=0),
+        yaxis=dict(color="#9ca3af", showgrid=True, gridcolor="rgba(148,163,184,0.1)", title="Percentage (%)", range=[0, 100]),
+        xaxis=dict(color="#9ca3af", showgrid=False, title=""),
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+        hovermode="x unified"
+    )
+
+    return corr_fig
+
+def render_corr(data: dict[str, np.ndarray], start_date, end_date):
+    """
+    Correlation card for the selected date range.
+    """
+    html_parts = [
+        "<div class='card-title'>Happiness Score with Soil Moisture & Ambient Light</div>",
+        f"<div class='card-caption'>Combined view of happiness score influenced by soil and light levels ({start_date} to {end_date}).</div>",
+    ]
+    st.markdown(f"<div class='card'>{''.join(html_parts)}</div>", unsafe_allow_html=True)
+
+    st.plotly_chart(corr_figure(data), width="stretch")
+
 # ---------- MAIN APP LAYOUT ----------
 # 🟢 MODIFIED: Load real data from InfluxDB
 df = load_data()
@@ -269,7 +633,11 @@ with st.sidebar:
 
 start_dt = datetime.combine(start_date, datetime.min.time())
 end_dt = datetime.combine(end_date, datetime.max.time())
-df_filtered = df[(df["timestamp"] >= start_dt) & (df["timestamp"] <= end_dt)]
+# Charts take ndarray views of these columns, so no filtered DataFrame is built
+data = chart_arrays(df)
+ts = data["timestamp"]
+ts_sorted = df["timestamp"].is_monotonic_increasing
+selected = time_range(ts, start_dt, end_dt, ts_sorted)
 
 latest = df.iloc[-1]
 latest_happiness = latest["happiness"]
@@ -303,7 +671,6 @@ with col_top[1]:
             <span style="font-size:50px;">🌿</span>
         </div>
     """
-    st.markdown(avatar_html, unsafe_allow_html=True)
     
     # 3. Happiness Score Value (Centered due to 'text-align:center' on parent card)
     score_html = f"""
@@ -311,7 +678,6 @@ with col_top[1]:
             {int(latest_happiness)}%
         </div>
     """
-    st.markdown(score_html, unsafe_allow_html=True)
 
 
     # 4. Dynamic status chip (Centered because it's an inline-flex element inside a centered block)
@@ -334,92 +700,46 @@ with col_top[1]:
             </div>
         </div>
     """
-    st.markdown(chip_html, unsafe_allow_html=True)
-    st.markdown("</div>", unsafe_allow_html=True) # Closing the card
+
+    # Send the whole avatar block as one markdown element
+    st.markdown("\n".join([avatar_html, score_html, chip_html]), unsafe_allow_html=True)
 
 
 # 🔴 MODIFIED: Changed from "24-Hour Trends" to "Last 7 Days Sensor Data"
 st.markdown("<h3>Sensor Trends (Last 7 Days)</h3>", unsafe_allow_html=True)
 
 # 🟢 MODIFIED: Show last 7 days instead of 24 hours
-last_7_days = df[df["timestamp"] > df["timestamp"].max() - timedelta(days=7)]
+ts_max = ts[-1] if ts_sorted else ts.max()
+recent = time_range(ts, ts_max - np.timedelta64(7, "D"), ts_max, ts_sorted, inclusive="right")
 col_soil, col_light = st.columns(2)
 
 
 # SOIL SENSOR - 🟢 MODIFIED: Now showing 7 days of real data
 with col_soil:
-    st.markdown('<div class="card">', unsafe_allow_html=True)
-    st.markdown("<div class='card-title'>Soil Moisture (Last 7 Days)</div>", unsafe_allow_html=True)
-    st.markdown(f"<div class='card-caption'>Current: **{latest['soil_pct']:.1f}%** (Target: {IDEAL_SOIL_MIN}% - {IDEAL_SOIL_MAX}%)</div>", unsafe_allow_html=True)
-    st.markdown("<hr style='border:0;border-top:1px solid rgba(148,163,184,0.2);margin:8px 0 12px;'>", unsafe_allow_html=True)
+    html_parts = [
+        "<div class='card-title'>Soil Moisture (Last 7 Days)</div>",
+        f"<div class='card-caption'>Current: **{latest['soil_pct']:.1f}%** (Target: {IDEAL_SOIL_MIN}% - {IDEAL_SOIL_MAX}%)</div>",
+        CARD_DIVIDER,
+    ]
+    st.markdown(f"<div class='card'>{''.join(html_parts)}</div>", unsafe_allow_html=True)
     
-    soil_fig = plot_sensor_data(last_7_days, "soil_pct", "#38bdf8", IDEAL_SOIL_MIN, IDEAL_SOIL_MAX, yaxis_title="Moisture (%)")
+    soil_fig = plot_sensor_data(ts[recent], data["soil_pct"][recent], "#38bdf8", IDEAL_SOIL_MIN, IDEAL_SOIL_MAX, yaxis_title="Moisture (%)")
     st.plotly_chart(soil_fig, width="stretch")
-    st.markdown("</div>", unsafe_allow_html=True)
 
 
 # AMBIENT LIGHT - 🟢 MODIFIED: Now showing 7 days of real data
 with col_light:
-    st.markdown('<div class="card">', unsafe_allow_html=True)
-    st.markdown("<div class='card-title'>Ambient Light (Last 7 Days)</div>", unsafe_allow_html=True)
-    st.markdown(f"<div class='card-caption'>Current: **{latest['light_pct']:.1f}%**</div>", unsafe_allow_html=True)
-    st.markdown("<hr style='border:0;border-top:1px solid rgba(148,163,184,0.2);margin:8px 0 12px;'>", unsafe_allow_html=True)
-
-    light_fig = plot_sensor_data(last_7_days, "light_pct", "#facc15", yaxis_title="Light (%)")
+    html_parts = [
+        "<div class='card-title'>Ambient Light (Last 7 Days)</div>",
+        f"<div class='card-caption'>Current: **{latest['light_pct']:.1f}%**</div>",
+        CARD_DIVIDER,
+    ]
+    st.markdown(f"<div class='card'>{''.join(html_parts)}</div>", unsafe_allow_html=True)
+
+    light_fig = plot_sensor_data(ts[recent], data["light_pct"][recent], "#facc15", yaxis_title="Light (%)")
     st.plotly_chart(light_fig, width="stretch")
-    st.markdown("</div>", unsafe_allow_html=True)
 
 
 # 🔴 MODIFIED: Changed from "Correlation Analysis" to "Happiness Score with Soil & Light"
 st.markdown("<h3>Happiness Score Analysis (Last 7 Days)</h3>", unsafe_allow_html=True)
-st.markdown('<div class="card">', unsafe_allow_html=True)
-st.markdown("<div class='card-title'>Happiness Score with Soil Moisture & Ambient Light</div>", unsafe_allow_html=True)
-st.markdown(f"<div class='card-caption'>Combined view of happiness score influenced by soil and light levels ({start_date} to {end_date}).</div>", unsafe_allow_html=True)
-
-# 🟢 MODIFIED: Now includes happiness score in the chart
-corr_df = df_filtered.set_index("timestamp")[["soil_pct", "light_pct", "happiness"]]
-
-corr_fig = go.Figure()
-
-# 🟢 NEW: Add happiness score trace
-corr_fig.add_trace(go.Scatter(
-    x=corr_df.index,
-    y=corr_df["happiness"],
-    mode="lines",
-    name="Happiness (%)",
-    line=dict(width=3, color="#22c55e"),
-    yaxis="y1"
-))
-
-corr_fig.add_trace(go.Scatter(
-    x=corr_df.index,
-    y=corr_df["soil_pct"],
-    mode="lines",
-    name="Soil (%)",
-    line=dict(width=2, color="#38bdf8", dash="dash"),
-    yaxis="y1"
-))
-
-corr_fig.add_trace(go.Scatter(
-    x=corr_df.index,
-    y=corr_df["light_pct"],
-    mode="lines",
-    name="Light (%)",
-    line=dict(width=2, color="#facc15", dash="dot"),
-    yaxis="y1"
-))
-
-corr_fig.update_layout(
-    height=350,
-    paper_bgcolor='rgba(0,0,0,0)',
-    plot_bgcolor='rgba(0,0,0,0)',
-    margin=dict(l=0, r=0, t=20, b=0),
-    yaxis=dict(color="#9ca3af", showgrid=True, gridcolor="rgba(148,163,184,0.1)", title="Percentage (%)", range=[0, 100]),
-    xaxis=dict(color="#9ca3af", showgrid=False, title=""),
-    legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-    hovermode="x unified"
-)
-
-st.plotly_chart(corr_fig, width="stretch")
-
-st.markdown("</div>", unsafe_allow_html=True)
\ No newline at end of file
+render_corr({column: values[selected] for column, values in data.items()}, start_date, end_date)
@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+from numba import njit, prange
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
@@ -14,6 +15,7 @@ LIGHT_LOW = 450
 LIGHT_HIGH = 3000
 IDEAL_SOIL_MIN = 35 # %
 IDEAL_SOIL_MAX = 75 # %
+PARALLEL_MIN_ROWS = 10_000  # below this, thread start-up costs more than it saves
 
 
 # ---------- PAGE CONFIG (UNCHANGED) ----------
@@ -105,6 +107,31 @@ h3 {
 st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 # ---------- DATA GENERATION (UNCHANGED) ----------
+def _compute_scores(soil_raw, light_raw, out_soil_pct, out_light_pct, out_happiness):
+    """
+    Fused kernel: soil %, light % and happiness in one pass, no temporaries.
+    The module constants are compile-time literals for numba.
+    """
+    soil_mid = (IDEAL_SOIL_MIN + IDEAL_SOIL_MAX) / 2
+    soil_half = (IDEAL_SOIL_MAX - IDEAL_SOIL_MIN) / 2
+    for i in prange(len(soil_raw)):
+        soil_pct = min(max((SOIL_DRY - soil_raw[i]) / (SOIL_DRY - SOIL_WET) * 100, 0.0), 100.0)
+        light_pct = min(max((light_raw[i] - LIGHT_LOW) / (LIGHT_HIGH - LIGHT_LOW) * 100, 0.0), 100.0)
+
+        # Simplified happiness score calculation
+        if IDEAL_SOIL_MIN <= soil_pct <= IDEAL_SOIL_MAX:
+            soil_score = 100.0
+        else:
+            soil_score = min(max((1 - abs(soil_pct - soil_mid) / soil_half) * 100, 0.0), 100.0)
+
+        out_soil_pct[i] = soil_pct
+        out_light_pct[i] = light_pct
+        out_happiness[i] = 0.6 * soil_score + 0.4 * light_pct
+
+compute_scores = njit(cache=True, fastmath=True)(_compute_scores)
+# Not cached on disk: numba's cache index would not tell it apart from the serial build
+compute_scores_parallel = njit(fastmath=True, parallel=True)(_compute_scores)
+
 @st.cache_data
 def load_data():
     now = datetime.now()
@@ -121,25 +148,16 @@ def load_data():
         }
     )
 
-    df["soil_pct"] = (SOIL_DRY - df["soil_raw"]) / (SOIL_DRY - SOIL_WET) * 100
-    df["soil_pct"] = df["soil_pct"].clip(0, 100)
-
-    df["light_pct"] = (df["light_raw"] - LIGHT_LOW) / (LIGHT_HIGH - LIGHT_LOW) * 100
-    df["light_pct"] = df["light_pct"].clip(0, 100)
+    n = len(times)
+    soil_pct = np.empty(n, dtype=np.float32)
+    light_pct = np.empty(n, dtype=np.float32)
+    happiness = np.empty(n, dtype=np.float32)
+    kernel = compute_scores_parallel if n > PARALLEL_MIN_ROWS else compute_scores
+    kernel(soil_raw, light_raw, soil_pct, light_pct, happiness)
 
-    # Simplified happiness score calculation
-    soil_score = np.where(
-        (df["soil_pct"] >= IDEAL_SOIL_MIN) & (df["soil_pct"] <= IDEAL_SOIL_MAX),
-        100,
-        (1 - np.abs(df["soil_pct"] - (IDEAL_SOIL_MIN + IDEAL_SOIL_MAX) / 2) / ((IDEAL_SOIL_MAX - IDEAL_SOIL_MIN) / 2)) * 100
-    ).clip(0, 100)
-
-    light_score = df["light_pct"]
-
-    df["happiness"] = (
-        0.6 * soil_score + 
-        0.4 * light_score
-    )
+    df["soil_pct"] = soil_pct
+    df["light_pct"] = light_pct
+    df["happiness"] = happiness
 
     return df
 